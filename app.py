@@ -1,4 +1,5 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import utils
@@ -32,6 +33,7 @@ start_date = col1.date_input("Start Date", value=datetime(2020, 1, 1))
 end_date = col2.date_input("End Date", value=datetime.today())
 
 num_simulations = st.sidebar.slider("Simulations", 1000, 50000, 10000, step=1000)
+seed = st.sidebar.number_input("Random Seed", min_value=0, value=42, step=1, help="Same seed and inputs give the same simulation.")
 run_btn = st.sidebar.button("Run Optimization", type="primary")
 
 # --- Main Logic ---
@@ -58,7 +60,7 @@ if run_btn:
                 if log_returns.empty:
                     st.error("❌ The selected stocks have NO overlapping trading days. Please choose stocks that traded during the same time period.")
                 else:
-                    sim_results, optimal_port = utils.perform_monte_carlo_simulation(log_returns, num_simulations)
+                    sim_results, optimal_port = utils.perform_monte_carlo_simulation(log_returns, num_simulations, seed=int(seed))
                     
                     # SAFETY CHECK: Calculation Success
                     if optimal_port is None:
@@ -82,11 +84,12 @@ if run_btn:
                         # Efficient Frontier Plot
                         with col_chart:
                             st.subheader("Efficient Frontier")
+                            # Plot a frontier-preserving subset instead of every simulation
+                            plot_df = utils.downsample_for_plot(sim_results)
                             fig = px.scatter(
-                                sim_results, x="Risk", y="Return", color="Sharpe Ratio",
+                                plot_df, x="Risk", y="Return", color="Sharpe Ratio",
                                 color_continuous_scale="Viridis",
-                                title="Monte Carlo Simulation",
-                                hover_data=stock_prices.columns
+                                title="Monte Carlo Simulation"
                             )
                             # Add optimal point
                             fig.add_scatter(
@@ -100,12 +103,13 @@ if run_btn:
                         with col_weights:
                             st.subheader("Weights")
                             # Clean weights data
-                            assets = stock_prices.columns
-                            weights = optimal_port[assets]
+                            assets = np.array(list(optimal_port['weights'].keys()))
+                            weights = np.array(list(optimal_port['weights'].values()))
                             
-                            # Filter out tiny weights (< 1%) for cleaner view
-                            weights_df = pd.DataFrame({'Asset': assets, 'Weight': weights})
-                            weights_df = weights_df[weights_df['Weight'] > 0.001].sort_values(by='Weight', ascending=False)
+                            # Filter out tiny weights (< 0.1%) for cleaner view
+                            mask = weights > 0.001
+                            weights_df = pd.DataFrame({'Asset': assets[mask], 'Weight': weights[mask]})
+                            weights_df = weights_df.sort_values(by='Weight', ascending=False)
                             
                             # Display Table
                             st.dataframe(
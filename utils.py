@@ -1,95 +1,323 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
+import streamlit as st
 import yfinance as yf
+from numba import njit
 
-def fetch_stock_data(tickers, start_date, end_date):
+# On-disk price cache (one Parquet file per ticker/date range)
+CACHE_DIR = Path('.cache/prices')
+# Ranges ending today are still moving; historical ranges never expire
+LIVE_CACHE_TTL = timedelta(days=1)
+
+def _cache_path(ticker, start_date, end_date):
+    key = hashlib.md5(f"{ticker}|{start_date}|{end_date}".encode()).hexdigest()
+    return CACHE_DIR / f"{key}.parquet"
+
+def _load_cached_close(ticker, start_date, end_date):
     """
-    Fetches historical data for flexible tickers.
-    Returns the data DataFrame AND a list of failed tickers.
+    Returns the cached close series, or None on a miss or stale entry.
+    """
+    path = _cache_path(ticker, start_date, end_date)
+    if not path.exists():
+        return None
+
+    if pd.Timestamp(end_date).date() >= date.today():
+        age = time.time() - path.stat().st_mtime
+        if age > LIVE_CACHE_TTL.total_seconds():
+            return None
+
+    try:
+        return pd.read_parquet(path)['Close']
+    except Exception as e:
+        print(f"Error reading cache for {ticker}: {e}")
+        return None
+
+def _save_cached_close(ticker, start_date, end_date, series):
+    path = _cache_path(ticker, start_date, end_date)
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        series.to_frame('Close').to_parquet(path)
+    except Exception as e:
+        # Caching is best-effort; never fail the fetch because of it
+        print(f"Error writing cache for {ticker}: {e}")
+
+def _download_closes(tickers, start_date, end_date):
+    """
+    Downloads close prices for all tickers in one batched request.
+    Returns the closes DataFrame AND a list of failed tickers.
+    """
+    try:
+        # Single multi-symbol download; yfinance threads the requests internally.
+        # auto_adjust=True keeps split/dividend adjusted closes, like Ticker.history()
+        raw = yf.download(
+            tickers, start=start_date, end=end_date, group_by='ticker',
+            threads=True, progress=False, auto_adjust=True
+        )
+    except Exception as e:
+        print(f"Error fetching {', '.join(tickers)}: {e}")
+        return pd.DataFrame(), tickers
+
+    if raw is None or raw.empty:
+        return pd.DataFrame(), tickers
+
+    # Older yfinance versions return flat columns for a single ticker
+    if not isinstance(raw.columns, pd.MultiIndex):
+        raw = pd.concat({tickers[0]: raw}, axis=1)
+
+    available = set(raw.columns.get_level_values(0))
+    closes = pd.DataFrame({t: raw[t]['Close'] for t in tickers if t in available})
+
+    # Tickers that came back missing or all-NaN are treated as failed
+    failed_tickers = [t for t in tickers if t not in closes.columns or closes[t].isna().all()]
+    closes = closes.dropna(axis=1, how='all')
+
+    return closes, failed_tickers
+
+class _IncompleteFetch(Exception):
+    """
+    Carries a result with failed tickers out of the cached fetch.
+    st.cache_data does not memoize exceptions, so failures are retried.
     """
+    def __init__(self, stock_data, failed_tickers):
+        super().__init__(failed_tickers)
+        self.stock_data = stock_data
+        self.failed_tickers = failed_tickers
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _fetch_stock_data_cached(tickers, start_date, end_date):
     stock_data = {}
     failed_tickers = []
-    
-    # Unique tickers only, convert to uppercase
-    tickers = list(set([t.upper().strip() for t in tickers]))
 
+    missing = []
     for stock in tickers:
-        try:
-            ticker_obj = yf.Ticker(stock)
-            # Fetch slightly more data to ensure we have enough for returns calc
-            history = ticker_obj.history(start=start_date, end=end_date)
-            
-            if history.empty:
-                failed_tickers.append(stock)
-            else:
-                stock_data[stock] = history['Close']
-                
-        except Exception as e:
-            print(f"Error fetching {stock}: {e}")
-            failed_tickers.append(stock)
-            
-    if not stock_data:
-        return pd.DataFrame(), failed_tickers
-        
-    return pd.DataFrame(stock_data), failed_tickers
+        cached = _load_cached_close(stock, start_date, end_date)
+        if cached is None:
+            missing.append(stock)
+        else:
+            stock_data[stock] = cached
+
+    if missing:
+        closes, failed_tickers = _download_closes(missing, start_date, end_date)
+        for stock in closes.columns:
+            series = closes[stock].dropna()
+            _save_cached_close(stock, start_date, end_date, series)
+            stock_data[stock] = series
+
+    stock_data = pd.DataFrame(stock_data) if stock_data else pd.DataFrame()
+
+    # Failures may be transient (network errors), so keep them out of the cache
+    if failed_tickers:
+        raise _IncompleteFetch(stock_data, failed_tickers)
+
+    return stock_data, failed_tickers
+
+def fetch_stock_data(tickers, start_date, end_date):
+    """
+    Fetches historical data for flexible tickers, using the on-disk cache first.
+    Returns the data DataFrame AND a list of failed tickers.
+    """
+    # Unique tickers only, convert to uppercase
+    tickers = sorted(set([t.upper().strip() for t in tickers]))
+
+    try:
+        return _fetch_stock_data_cached(tickers, start_date, end_date)
+    except _IncompleteFetch as e:
+        return e.stock_data, e.failed_tickers
 
+def _hash_frame(df):
+    # Content hash; column labels are included since values alone ignore them
+    return (tuple(df.columns), pd.util.hash_pandas_object(df).values.tobytes())
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _hash_frame})
 def calculate_log_returns(stock_prices):
     """
     Calculates log returns from price data.
     """
-    # dropna() removes rows where ANY stock is missing data.
+    # log(P_t / P_t-1) == log(P_t) - log(P_t-1): one log pass, no shifted copy
+    log_prices = np.log(stock_prices.to_numpy(dtype=np.float64, copy=False))
+    returns = np.diff(log_prices, axis=0)
+
+    # Drop rows where ANY stock is missing data.
     # If stocks have no overlapping dates, this becomes empty.
-    return np.log(stock_prices / stock_prices.shift(1)).dropna()
+    keep = ~np.isnan(returns).any(axis=1)
+    return pd.DataFrame(returns[keep], index=stock_prices.index[1:][keep], columns=stock_prices.columns)
 
-def perform_monte_carlo_simulation(log_returns, num_simulations, risk_free_rate=0.0):
+def _risk_factor(cov):
+    """
+    Returns L with L @ L.T == cov, so portfolio risk is |w @ L|.
+    """
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        # Semi-definite covariances (e.g. flat prices) get an exact eigen factor;
+        # no jitter, so zero volatility still yields zero risk
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        return eigvecs * np.sqrt(np.clip(eigvals, 0.0, None))
+
+# Simulations per chunk; a chunk's weights and outputs stay cache resident
+CHUNK_SIZE = 4096
+
+@njit(nogil=True, fastmath=True, cache=True)
+def _mc_kernel(weights, mean, L_chol, ret_out, risk_out):
+    """
+    Normalizes pre-drawn weights in place and scores every portfolio in one
+    pass, writing into ret_out and risk_out. Releases the GIL so chunks can
+    run on parallel threads.
+    Plain loops on purpose: no einsum or temporaries inside the kernel.
+    """
+    num_sim, num_tickers = weights.shape
+
+    # Accumulation stays in float64 registers; stored results are float32
+    for i in range(num_sim):
+        w = weights[i]
+        total = 0.0
+        for j in range(num_tickers):
+            total += w[j]
+
+        r = 0.0
+        for j in range(num_tickers):
+            w[j] /= total
+            r += w[j] * mean[j]
+
+        # risk = |w @ L|
+        var = 0.0
+        for k in range(num_tickers):
+            y = 0.0
+            for j in range(num_tickers):
+                y += w[j] * L_chol[j, k]
+            var += y * y
+
+        ret_out[i] = r
+        risk_out[i] = np.sqrt(var)
+
+def _simulate_chunk(seed_seq, num_sim, mean, L_chol, risk_free_rate):
+    """
+    Simulates one chunk of portfolios with its own generator.
+    Returns the chunk's returns, risks and Sharpe ratios, plus the index and
+    weights of its best portfolio (-1 and None if every Sharpe is NaN).
+    """
+    # Normalized standard exponentials are Dirichlet(1, ..., 1) draws, i.e.
+    # uniform over the simplex
+    rng = np.random.default_rng(seed_seq)
+    weights = np.empty((num_sim, len(mean)), dtype=np.float32)
+    rng.standard_exponential(out=weights, dtype=np.float32)
+
+    returns = np.empty(num_sim, dtype=np.float32)
+    risks = np.empty(num_sim, dtype=np.float32)
+    _mc_kernel(weights, mean, L_chol, returns, risks)
+
+    # Handle division by zero gracefully
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpes = (returns - risk_free_rate) / risks
+
+    valid = np.flatnonzero(~np.isnan(sharpes))
+    if not valid.size:
+        return returns, risks, sharpes, -1, None
+
+    best_i = valid[np.argmax(sharpes[valid])]
+    return returns, risks, sharpes, best_i, weights[best_i].copy()
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _hash_frame})
+def _annualized_stats(log_returns):
+    """
+    Returns annualized mean returns and covariance as numpy arrays.
+    """
+    arr = log_returns.to_numpy(dtype=np.float64, copy=False)
+    mean_returns = arr.mean(axis=0) * 252
+    cov_matrix = np.cov(arr, rowvar=False) * 252
+    return mean_returns, cov_matrix
+
+def perform_monte_carlo_simulation(log_returns, num_simulations, risk_free_rate=0.0, seed=None):
     """
     Performs Monte Carlo simulation.
+    Weights are sampled uniformly over the simplex (Dirichlet with all ones);
+    pass a seed for reproducible results. Seeded runs are memoized per input set.
+    Returns the results DataFrame and a dict with the optimal portfolio's
+    Return, Risk, Sharpe Ratio and per-ticker weights.
     """
+    # Unseeded runs are meant to differ, so only seeded runs hit the cache
+    if seed is None:
+        return _monte_carlo_simulation(log_returns, num_simulations, risk_free_rate, seed)
+    return _cached_monte_carlo_simulation(log_returns, num_simulations, risk_free_rate, seed)
+
+# Bounded: each entry holds a full set of simulation results
+@st.cache_data(show_spinner=False, max_entries=8, hash_funcs={pd.DataFrame: _hash_frame})
+def _cached_monte_carlo_simulation(log_returns, num_simulations, risk_free_rate, seed):
+    return _monte_carlo_simulation(log_returns, num_simulations, risk_free_rate, seed)
+
+def _monte_carlo_simulation(log_returns, num_simulations, risk_free_rate, seed):
     # SAFETY CHECK 1: Ensure we have data to simulate
-    if log_returns.empty or len(log_returns) < 2:
+    if log_returns.empty or len(log_returns) < 2 or num_simulations < 1:
         return pd.DataFrame(), None
 
-    num_tickers = len(log_returns.columns)
-    
-    # Annualized parameters
-    mean_returns = log_returns.mean() * 252
-    cov_matrix = log_returns.cov() * 252
+    # Annualized parameters (cached; unchanged when only the simulation count moves)
+    mean_returns, cov_matrix = _annualized_stats(log_returns)
     
-    # Generate random weights
-    all_weights = np.random.random((num_simulations, num_tickers))
-    all_weights = all_weights / np.sum(all_weights, axis=1)[:, np.newaxis]
-    
-    # Portfolio Returns
-    port_returns = np.sum(all_weights * mean_returns.values, axis=1)
-    
-    # Portfolio Risk
-    # Optimized calculation using Einstein summation for speed
-    port_risks = np.sqrt(np.einsum('ij,jk,ik->i', all_weights, cov_matrix, all_weights))
-    
-    # Calculate Sharpe Ratio (Handle division by zero gracefully)
-    with np.errstate(divide='ignore', invalid='ignore'):
-        sharpe_ratios = (port_returns - risk_free_rate) / port_risks
+    # Factor the covariance once; each portfolio's risk is then |w @ L|.
+    # Factor in float64 for stability, then simulate in float32.
+    L = _risk_factor(cov_matrix).astype(np.float32)
+    mean_returns = mean_returns.astype(np.float32)
     
-    # Create results DataFrame
-    sim_data = {
-        'Return': port_returns,
-        'Risk': port_risks,
-        'Sharpe Ratio': sharpe_ratios
-    }
+    # Independent chunks, each with its own child seed, spread over threads.
+    # Seeding per chunk keeps results independent of the core count.
+    sizes = [min(CHUNK_SIZE, num_simulations - start) for start in range(0, num_simulations, CHUNK_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        chunks = list(executor.map(
+            lambda seed_seq, n: _simulate_chunk(seed_seq, n, mean_returns, L, risk_free_rate),
+            seeds, sizes
+        ))
     
-    # Add weights
-    for idx, ticker in enumerate(log_returns.columns):
-        sim_data[ticker] = all_weights[:, idx]
-        
-    results_df = pd.DataFrame(sim_data)
+    port_returns = np.concatenate([c[0] for c in chunks])
+    port_risks = np.concatenate([c[1] for c in chunks])
+    sharpe_ratios = np.concatenate([c[2] for c in chunks])
     
     # SAFETY CHECK 2: Drop results that turned out NaN (e.g. 0 volatility)
-    results_df = results_df.dropna()
-
-    if results_df.empty:
+    offsets = np.cumsum([0] + sizes[:-1])
+    winners = [
+        (offset + best, weights)
+        for offset, (_, _, _, best, weights) in zip(offsets, chunks) if best >= 0
+    ]
+    if not winners:
         return pd.DataFrame(), None
     
-    max_sharpe_idx = results_df['Sharpe Ratio'].idxmax()
-    optimal_portfolio = results_df.loc[max_sharpe_idx]
+    # Global optimum is the best of the per-chunk winners
+    best_i, best_weights = max(winners, key=lambda winner: sharpe_ratios[winner[0]])
+    valid = ~np.isnan(sharpe_ratios)
+    
+    results_df = pd.DataFrame({
+        'Return': port_returns[valid],
+        'Risk': port_risks[valid],
+        'Sharpe Ratio': sharpe_ratios[valid]
+    })
+    
+    optimal_portfolio = {
+        'Return': float(port_returns[best_i]),
+        'Risk': float(port_risks[best_i]),
+        'Sharpe Ratio': float(sharpe_ratios[best_i]),
+        'weights': dict(zip(log_returns.columns, best_weights.tolist()))
+    }
     
     return results_df, optimal_portfolio
+
+def downsample_for_plot(sim_results, num_edge=500, num_sample=4000):
+    """
+    Reduces simulation results to a plot-sized subset.
+    Keeps the best Sharpe and lowest risk points (the visible frontier)
+    plus a random sample of the interior.
+    """
+    if len(sim_results) <= 2 * num_edge + num_sample:
+        return sim_results
+
+    return pd.concat([
+        sim_results.nlargest(num_edge, 'Sharpe Ratio'),
+        sim_results.nsmallest(num_edge, 'Risk'),
+        sim_results.sample(num_sample, random_state=0)
+    ]).drop_duplicates()